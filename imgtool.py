@@ -10,8 +10,25 @@
 
 import argparse
 import os, sys
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, features
 from pathlib import Path
+from typing import Iterator
+
+
+RESAMPLE_FILTERS = {
+    "bicubic": Image.Resampling.BICUBIC,
+    "bilinear": Image.Resampling.BILINEAR,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+# This way .jpg, .JPG, .jpeg, .JPEG (and even mixed case like .JpEg) are matched once lowercased
+JPG_EXTENSIONS = (".jpg", ".jpeg")
+
+SUBSAMPLING_MODES = ("4:4:4", "4:2:2", "4:2:0")
+
+# How many files ahead of the encoder the batch mode asks the kernel to read
+PREFETCH_DEPTH = 32
 
 
 def compress_image(
@@ -20,6 +37,9 @@ def compress_image(
     quality: int = 85,
     max_width: int = None,
     max_height: int = None,
+    resample: Image.Resampling = Image.Resampling.BICUBIC,
+    subsampling: str = "4:2:0",
+    fast: bool = False,
     delete_original: bool = False,
 ) -> None:
     """
@@ -31,26 +51,42 @@ def compress_image(
         quality (int): JPG quality (1-95). Lower = more compression.
         max_width (int): Optional max width.
         max_height (int): Optional max height.
+        resample (Image.Resampling): Resampling filter used when resizing.
+        subsampling (str): Chroma subsampling (4:4:4, 4:2:2 or 4:2:0). Coarser = smaller and faster.
+        fast (bool): Whether to skip the Huffman optimization pass and progressive scans (baseline JPG, ~2x faster encode).
         delete_original (bool): Whether to delete the original JPG file after successful compression.
     """
 
     try:
         # Open image without loading EXIF
         with Image.open(input_file) as img:
-            # Convert to RGB to avoid issues with PNG or other formats
-            img = img.convert("RGB")
+            # Let libjpeg scale down by 1/2, 1/4 or 1/8 while decoding when resizing. draft needs the final
+            # size on both axes, so derive the unbounded one from the aspect ratio instead of the full source size
+            if max_width or max_height:
+                scale = min(
+                    1,
+                    max_width / img.width if max_width else 1,
+                    max_height / img.height if max_height else 1,
+                )
+                # Very wide or tall images would otherwise round an axis down to 0, which draft divides by
+                img.draft("RGB", (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+
+            # Convert to RGB to avoid issues with PNG or other formats (skip the copy if it already is)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
 
             # Resize if requested
             if max_width or max_height:
-                img.thumbnail((max_width or img.width, max_height or img.height))
+                img.thumbnail((max_width or img.width, max_height or img.height), resample=resample)
 
             # Save without metadata
             img.save(
                 output_file,
                 format="JPEG",
                 quality=quality,
-                optimize=True,
-                progressive=True,
+                subsampling=subsampling,
+                optimize=not fast,
+                progressive=not fast,
             )
 
         # Only delete original file if output exists and flag is set
@@ -64,11 +100,15 @@ def compress_image(
 
 def single_file_mode(args) -> None:
     input_file = args.input
-    output_file = args.output if args.output else f"{Path(input_file).stem}_compressed{Path(input_file).suffix}"
+    input_path = Path(input_file)
+    output_file = args.output if args.output else f"{input_path.stem}_compressed{input_path.suffix}"
 
     quality = args.quality
     max_width = args.max_width
     max_height = args.max_height
+    resample = RESAMPLE_FILTERS[args.filter]
+    subsampling = args.subsampling
+    fast = args.fast
     delete_original = args.delete_original
     force = args.force
     verbose = args.verbose
@@ -76,10 +116,11 @@ def single_file_mode(args) -> None:
     validate_quality(quality=quality)
     validate_args_single_file(input_file=input_file, output_file=output_file, force=force)
 
-    log(verbose=verbose,
-        message=f"\n 🚀 \033[1;37m Processing:\033[1;32m  {Path(input_file).name}\033[0m")
+    log(verbose,
+        "\n 🚀 \033[1;37m Processing:\033[1;32m  {}\033[0m",
+        input_path.name)
 
-    input_size = str(os.path.getsize(input_file) / 1000000)
+    input_size = os.path.getsize(input_file) if verbose else 0
 
     compress_image(
         input_file=input_file,
@@ -87,13 +128,17 @@ def single_file_mode(args) -> None:
         quality=quality,
         max_width=max_width,
         max_height=max_height,
+        resample=resample,
+        subsampling=subsampling,
+        fast=fast,
         delete_original=delete_original,
     )
 
-    output_size = str(os.path.getsize(output_file) / 1000000)
+    output_size = os.path.getsize(output_file) if verbose else 0
 
-    log(verbose=verbose,
-        message=f" ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {input_size} MB\n   Output file size: {output_size} MB\033[0m")
+    log(verbose,
+        " ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {:.2f} MB\n   Output file size: {:.2f} MB\033[0m",
+        input_size / 1000000, output_size / 1000000)
 
 
 def batch_file_mode(args) -> None:
@@ -101,64 +146,173 @@ def batch_file_mode(args) -> None:
     output_folder = Path(args.output_folder) if args.output_folder else Path(f"{input_folder}_compressed")
 
     quality = args.quality
-    max_width = args.max_width
-    max_height = args.max_height
-    delete_original = args.delete_original
+    jobs = args.jobs
     recursive = args.recursive
     verbose = args.verbose
 
     validate_quality(quality=quality)
+    validate_jobs(jobs=jobs)
     validate_args_batch_file(input_folder=input_folder)
 
-    # This way .jpg, .JPG, .jpeg, .JPEG (and even mixed case like .JpEg) are matched
-    extensions = [".jpg", ".jpeg"]
-    jpg_files = [
-        f for f in (input_folder.rglob("*") if recursive else input_folder.glob("*"))
-        if f.suffix.lower() in extensions
-    ]
+    entries = list(iter_jpegs(root=input_folder, recursive=recursive))
+    jpg_files = [Path(entry.path) for entry in entries]
 
     if not jpg_files:
         print(" ❌ \033[1;35mNo JPG files found in the input folder.\033[0m")
         return
 
-    output_folder.mkdir(parents=True, exist_ok=True)
-
-    for jpg in jpg_files:
+    # Keyword arguments shared by every compress_image call of the batch
+    options = {
+        "quality": quality,
+        "max_width": args.max_width,
+        "max_height": args.max_height,
+        "resample": RESAMPLE_FILTERS[args.filter],
+        "subsampling": args.subsampling,
+        "fast": args.fast,
+        "delete_original": args.delete_original,
+    }
+
+    # Start reading the first files while the workers spin up
+    for jpg in jpg_files[:PREFETCH_DEPTH]:
+        prefetch(jpg)
+
+    tasks = []
+    created_folders = set()
+    for index, jpg in enumerate(jpg_files):
         relative_path = jpg.relative_to(input_folder)
         output_file = output_folder / relative_path
 
-        output_file.parent.mkdir(parents=True, exist_ok=True)
+        # Create each output subfolder once, instead of once per file
+        if output_file.parent not in created_folders:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            created_folders.add(output_file.parent)
+
+        # Each worker prefetches the file PREFETCH_DEPTH positions ahead of the one it compresses
+        ahead = index + PREFETCH_DEPTH
+        prefetch_file = jpg_files[ahead] if ahead < len(jpg_files) else None
+
+        # Reuse the scanned directory entry for the input size (free on Windows, one stat elsewhere)
+        input_size = entries[index].stat().st_size if verbose else 0
+
+        tasks.append((jpg, output_file, input_size, options, verbose, prefetch_file))
+
+    max_workers = jobs or os.cpu_count() or 1
+
+    # Small batches are not worth the process pool startup overhead
+    if len(tasks) < 4 or max_workers == 1:
+        results = [_worker(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_worker, tasks, chunksize=4))
+
+    processed = [(input_size, output_size) for _, input_size, output_size in results if output_size is not None]
+    failed = [input_file for input_file, _, output_size in results if output_size is None]
+
+    total_input_size = sum(input_size for input_size, _ in processed)
+    total_output_size = sum(output_size for _, output_size in processed)
+
+    log(verbose,
+        "\n\033[1;37m  Batch compression completed.\033[1;32m {}\033[1;37m files processed and saved at:\033[1;32m {}/\033[0m",
+        len(processed), output_folder)
+    log(verbose,
+        "\033[1;32m   Total input size: {:.2f} MB\n   Total output size: {:.2f} MB\033[0m",
+        total_input_size / 1000000, total_output_size / 1000000)
+
+    if failed:
+        print(f" ❌ \033[1;35m{len(failed)} of {len(results)} files failed:\033[1;36m {', '.join(map(str, failed))}\033[0m", file=sys.stderr)
+        sys.exit(1)
 
-        log(verbose=verbose,
-            message=f"\n 🚀 \033[1;37m Processing:\033[1;32m  {jpg.name}\033[0m")
 
-        input_size = str(os.path.getsize(jpg) / 1000000)
+def iter_jpegs(root: str, recursive: bool = False) -> Iterator[os.DirEntry]:
+    """
+    Yield the directory entries of the JPG files in a folder with a single scandir pass per directory.
 
-        compress_image(
-            input_file=jpg,
-            output_file=output_file,
-            quality=quality,
-            max_width=max_width,
-            max_height=max_height,
-            delete_original=delete_original,
-        )
+    Args:
+        root (str): Folder to scan.
+        recursive (bool): Whether to also scan subfolders.
+    """
 
-        output_size = str(os.path.getsize(output_file) / 1000000)
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(JPG_EXTENSIONS) and entry.is_file():
+                    yield entry
 
-        log(verbose=verbose,
-            message=f" ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {input_size} MB\n   Output file size: {output_size} MB\033[0m")
 
-    log(verbose=verbose,
-        message=f"\n\033[1;37m  Batch compression completed.\033[1;32m {len(jpg_files)}\033[1;37m files processed and saved at:\033[1;32m {output_folder}/\033[0m")
+def _worker(task: tuple) -> tuple:
+    """
+    Compress a single image of a batch. Kept at module level so it can be dispatched to a process pool.
+    A failure is reported with the file name and returned instead of raised, so it does not cancel the images still queued.
+
+    Args:
+        task (tuple): (input_file, output_file, input_size, options, verbose, prefetch_file),
+            where options are the compress_image keyword arguments and input_size is 0 when not verbose.
+
+    Returns:
+        tuple: Input file, and input and output file sizes in bytes (0 when not verbose, output size None when it failed).
+    """
+
+    input_file, output_file, input_size, options, verbose, prefetch_file = task
+
+    if prefetch_file:
+        prefetch(prefetch_file)
+
+    try:
+        compress_image(input_file=input_file, output_file=output_file, **options)
+    except SystemExit:
+        # compress_image already reported the error with the file name
+        return input_file, input_size, None
+
+    output_size = os.path.getsize(output_file) if verbose else 0
+
+    # One write per file, so the messages of parallel workers do not interleave
+    log(verbose,
+        "\n 🚀 \033[1;37m Processing:\033[1;32m  {}\033[0m\n ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {:.2f} MB\n   Output file size: {:.2f} MB\033[0m",
+        input_file.name, input_size / 1000000, output_size / 1000000)
+
+    return input_file, input_size, output_size
+
+
+def prefetch(path: str) -> None:
+    """
+    Ask the kernel to start reading a file into the page cache in the background,
+    so the read overlaps with the encoding of the previous files. No-op where posix_fadvise is not available.
+
+    Args:
+        path (str): Path of the file that will be read soon.
+    """
+
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
 
 
 def validate_quality(quality: int) -> None:
     # Check if the quality is valid
-    if quality not in range(1, 95):
+    if not 1 <= quality <= 95:
         print(f" ❌ \033[1;35mInvalid quality value:\033[1;36m {quality}\033[0m", file=sys.stderr)
         sys.exit(2)
 
 
+def validate_jobs(jobs: int) -> None:
+    # Check if the number of parallel jobs is valid
+    if jobs is not None and jobs < 1:
+        print(f" ❌ \033[1;35mInvalid number of jobs:\033[1;36m {jobs}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+
 def validate_args_single_file(input_file: str, output_file: str, force: bool = False) -> None:
     # Check if the input file exists
     if not os.path.isfile(input_file):
@@ -166,12 +320,12 @@ def validate_args_single_file(input_file: str, output_file: str, force: bool = F
         sys.exit(2)
 
     # Check if the input file is a .jpg file
-    if not input_file.lower().endswith((".jpg", ".jpeg")):
+    if not input_file.lower().endswith(JPG_EXTENSIONS):
         print(f" ❌ \033[1;35mInput file needs to be a (.jpg, .jpeg) file:\033[1;36m {input_file}\033[0m", file=sys.stderr)
         sys.exit(2)
 
     # Check if the output file is a .jpg file
-    if not output_file.lower().endswith((".jpg", ".jpeg")) and not force:
+    if not output_file.lower().endswith(JPG_EXTENSIONS) and not force:
         ask = f" ❔ \033[1;31mOutput file \033[1;36m\"{output_file}\"\033[1;31m does not end with (\".jpg\", \".jpeg\"). Are you sure you want to continue?\033[1;36m (y/n)\033[0m "
         confirm = input(ask)
         if confirm.lower() not in ("yes", "y"):
@@ -192,9 +346,18 @@ def validate_args_batch_file(input_folder: str) -> None:
         sys.exit(2)
 
 
-def log(message: str, verbose: bool) -> None:
+def check_jpeg_backend(verbose: bool) -> None:
+    # Check if Pillow is linked against libjpeg-turbo (SIMD JPEG encode/decode), only when the warning can be shown
+    if verbose and not features.check_feature("libjpeg_turbo"):
+        log(verbose,
+            " ⚠️  \033[1;33mPillow is not linked against libjpeg-turbo. Install Pillow-SIMD built with libjpeg-turbo for faster compression.\033[0m")
+
+
+def log(verbose: bool, message: str, *args) -> None:
+    # Only format the message when it is going to be printed, and write it out in a single call
     if verbose:
-        print(message)
+        sys.stdout.write((message.format(*args) if args else message) + "\n")
+        sys.stdout.flush()
 
 
 def main():
@@ -211,14 +374,20 @@ def main():
     parser.add_argument("-q", "--quality", type=int, default=85, help="JPG quality (1-95, default 85)")
     parser.add_argument("--max-width", type=int, default=None, help="Optional max width to resize")
     parser.add_argument("--max-height", type=int, default=None, help="Optional max height to resize")
+    parser.add_argument("--filter", choices=RESAMPLE_FILTERS, default="bicubic", help="Resampling filter used when resizing (default bicubic)")
+    parser.add_argument("--subsampling", choices=SUBSAMPLING_MODES, default="4:2:0", help="Chroma subsampling (default 4:2:0)")
+    parser.add_argument("--fast", action="store_true", help="Faster baseline encoding, without Huffman optimization and progressive scans")
 
     parser.add_argument("--delete-original", action="store_true", help="Delete original JPG files after successful compression")
     parser.add_argument("-f", "--force", action="store_true", help="Overwrite output files without confirmation")
     parser.add_argument("-r", "--recursive", action="store_true", help="Recursively process subfolders (only with --input-folder)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of files to compress in parallel in batch mode (default: number of CPUs)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
 
     args = parser.parse_args()
 
+    check_jpeg_backend(verbose=args.verbose)
+
     # Batch Mode
     if args.input_folder:
         batch_file_mode(args=args)
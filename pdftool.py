@@ -9,61 +9,199 @@
 ### ############################################################
 
 import argparse
-import os, re, subprocess, sys
+import collections, importlib.util, itertools, os, shutil, subprocess, sys, tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pypdf import PdfReader, PdfWriter
+from typing import BinaryIO, Iterable, Iterator
 
+# pypdf and pikepdf are slow to import, so they are only imported by the functions that need them,
+# keeping --help, validation errors and the plain Ghostscript path fast to start
 
-COMPRESSION_LEVELS = {
+# Optional: pikepdf (qpdf) edits the trailer and root without re-parsing every object like pypdf does.
+# Only tells whether it is installed, import_pikepdf() still falls back when it fails to import
+HAS_PIKEPDF = importlib.util.find_spec("pikepdf") is not None
+
+
+COMPRESSION_LEVELS = frozenset({
     "screen",
     "ebook",
     "printer",
     "prepress",
     "default",
+})
+
+# Listed in the invalid compression level error
+COMPRESSION_LEVELS_LIST = ", ".join(sorted(COMPRESSION_LEVELS))
+
+BACKENDS = ("auto", "ghostscript", "qpdf")
+
+# With the auto backend, PDFs with less image data than this skip Ghostscript and are only recompressed by qpdf
+QPDF_MAX_IMAGE_BYTES = 256 * 1024
+
+# Image resolution (dpi) and JPEG quality applied on top of each Ghostscript preset, tuned so images
+# are not re-encoded at a higher quality than the preset resolution can show
+QUALITY_IMAGE_SETTINGS = {
+    "screen": (72, 60),
+    "ebook": (150, 80),
+    "printer": (300, 90),
 }
 
+# Upper bound for Ghostscript band rendering threads, more than this stops paying off
+MAX_RENDERING_THREADS = 4
+
+# PostScript run after the input file so it overrides the document info Ghostscript carries over
+PDFMARK_STRIP_INFO = "[ /Title () /Author () /Subject () /Keywords () /Creator () /Producer () /DOCINFO pdfmark"
+
+# How many files ahead of the running Ghostscript processes the batch mode asks the kernel to read
+PREFETCH_DEPTH = 8
+
+# The "%PDF-" header may follow some junk bytes, readers look for it in the first kilobyte
+PDF_HEADER_WINDOW = 1024
+
+# Ghostscript output piped to pypdf is kept in memory up to this size, then spilled to a temporary file
+SPOOL_MAX_SIZE = 128 * 1024 * 1024
+
+# Characters not allowed in file names
+UNSAFE_CHARS = frozenset("|;`><{}#*")
+
+
+def import_pikepdf():
+    """
+    Import pikepdf on first use.
+
+    Returns:
+        module | None: The pikepdf module, or None when it is not installed or fails to import
+            (e.g. a missing native library), so the callers can take their fallback path.
+    """
+
+    if not HAS_PIKEPDF:
+        return None
+
+    try:
+        import pikepdf
+    except ImportError:
+        return None
+
+    return pikepdf
 
-def strip_pdf_metadata(input_path: str, output_path: str) -> None:
+
+def strip_pdf_metadata(input_path: str | BinaryIO, output_path: str) -> None:
     """
     Remove all metadata (Title, Author, Metadata streams, etc.) from a PDF.
+    Uses pikepdf when it is installed and imports, falling back to pypdf otherwise.
 
     Args:
-        input_path (str): Path to the input PDF file.
+        input_path (str | BinaryIO): Path to the input PDF file, or a binary stream positioned at its start.
         output_path (str): Path to save the output PDF without metadata.
     """
 
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
+    # The file is rewritten on purpose instead of appending an incremental update:
+    # an incremental update only hides the old /Info and /Metadata objects, their bytes stay in the file
+    pikepdf = import_pikepdf()
+    if pikepdf is not None:
+        with pikepdf.open(input_path) as pdf:
+            # Remove classic document info dictionary (/Info)
+            if "/Info" in pdf.trailer:
+                del pdf.trailer["/Info"]
 
-    # Copy only the pages
-    for page in reader.pages:
-        writer.add_page(page)
+            # Remove XMP /Metadata stream if present
+            if "/Metadata" in pdf.Root:
+                del pdf.Root["/Metadata"]
 
-    # Remove classic document info dictionary (/Info)
-    writer._info = None
+            # qpdf only writes the objects still reachable, so the removed ones are dropped from the file
+            pdf.save(output_path)
+
+        return
+
+    from pypdf import PdfWriter
 
-    # Remove XMP metadata
+    # Clone the whole document in one go instead of deep-copying it page by page
+    writer = PdfWriter(clone_from=input_path)
+
+    # Remove XMP /Metadata stream if present
+    writer._root_object.pop("/Metadata", None)
+
+    # Merge duplicated objects (fonts, images, ...) so they are only serialized once, and drop
+    # the objects that are no longer referenced, like the cloned /Metadata stream removed above.
+    # pypdf expects an /Info dictionary to exist here, so make sure there is one until it is removed below
     writer.add_metadata({})
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
 
-    # Remove /Metadata stream if present
-    if "/Metadata" in writer._root_object:
-        del writer._root_object["/Metadata"]
+    # Remove classic document info dictionary (/Info), last so nothing writes an empty one back into the trailer
+    writer._info = None
 
     # Write the clean PDF
     with open(output_path, "wb") as out_file:
         writer.write(out_file)
 
 
-def compress_pdf(input_path: str, output_path: str, quality: str = "ebook") -> None:
+def image_flags(quality: str, dpi: int = None, jpeg_quality: int = None) -> list:
+    """
+    Build the Ghostscript arguments that set the image downsampling resolution and JPEG quality of a compression level.
+
+    Args:
+        quality (str): One of screen, ebook, printer, prepress, default.
+        dpi (int): Resolution to downsample color and gray images to, overriding the level's one.
+        jpeg_quality (int): JPEG quality (1-100) to re-encode images with, overriding the level's one.
+
+    Returns:
+        list: Arguments to pass before the input file. Empty when the level has no tuning and nothing is overridden.
+    """
+
+    level_dpi, level_jpeg_quality = QUALITY_IMAGE_SETTINGS.get(quality, (None, None))
+    dpi = dpi or level_dpi
+    jpeg_quality = jpeg_quality or level_jpeg_quality
+
+    flags = []
+
+    if dpi:
+        for kind in ("Color", "Gray"):
+            flags += [
+                f"-dDownsample{kind}Images=true",
+                f"-d{kind}ImageDownsampleType=/Bicubic",
+                f"-d{kind}ImageResolution={dpi}",
+            ]
+
+    if jpeg_quality:
+        # pdfwrite ignores -dJPEGQ, it takes the JPEG quality as a QFactor: libjpeg's quality scaling divided by 100
+        scale = 5000 / jpeg_quality if jpeg_quality < 50 else 200 - 2 * jpeg_quality
+        qfactor = max(scale / 100, 0.01)
+
+        # Keep full chroma resolution for high qualities, like the printer and prepress presets do
+        samples = "[1 1 1 1]" if jpeg_quality >= 90 else "[2 1 1 2]"
+        dct = f"<< /QFactor {qfactor:.2f} /Blend 1 /HSamples {samples} /VSamples {samples} >>"
+
+        flags += [
+            "-c",
+            f"<< /ColorACSImageDict {dct} /GrayACSImageDict {dct} /ColorImageDict {dct} /GrayImageDict {dct} >> setdistillerparams",
+            "-f",
+        ]
+
+    return flags
+
+
+def compress_pdf(
+    input_path: str,
+    output_path: str | BinaryIO,
+    quality: str = "ebook",
+    rendering_threads: int = 1,
+    dpi: int = None,
+    jpeg_quality: int = None,
+) -> None:
     """
-    Compress a PDF using Ghostscript.
+    Compress a PDF and remove most of its metadata (document info, dates, ID and XMP) in a single Ghostscript pass.
 
     Args:
         input_path (str): Input PDF path.
-        output_path (str): Output compressed PDF path.
+        output_path (str | BinaryIO): Output compressed PDF path, or a binary stream to pipe Ghostscript's output into.
         quality (str): One of screen, ebook, printer, prepress, default.
+        rendering_threads (int): Number of threads Ghostscript may use to render bands.
+        dpi (int): Image resolution overriding the one of the quality level.
+        jpeg_quality (int): JPEG quality overriding the one of the quality level.
     """
 
+    to_stream = not isinstance(output_path, (str, os.PathLike))
+
     gs_command = [
         "gs",
         "-sDEVICE=pdfwrite",
@@ -72,114 +210,504 @@ def compress_pdf(input_path: str, output_path: str, quality: str = "ebook") -> N
         "-dNOPAUSE",
         "-dQUIET",
         "-dBATCH",
-        f"-sOutputFile={output_path}",
+        "-dOmitXMP=true",
+        "-dOmitInfoDate=true",
+        "-dOmitID=true",
+        f"-dNumRenderingThreads={rendering_threads}",
+        f"-sOutputFile={'-' if to_stream else output_path}",
+        *image_flags(quality=quality, dpi=dpi, jpeg_quality=jpeg_quality),
         input_path,
+        "-c",
+        PDFMARK_STRIP_INFO,
     ]
 
     try:
-        subprocess.run(gs_command, check=True)
+        if to_stream:
+            with subprocess.Popen(gs_command, stdout=subprocess.PIPE) as process:
+                shutil.copyfileobj(process.stdout, output_path)
+
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, gs_command)
+
+        else:
+            subprocess.run(gs_command, check=True)
+
     except subprocess.CalledProcessError:
-        print(" ❌ \033[1;35mGhostscript compression failed.\033[0m", file=sys.stderr)
+        print(f" ❌ \033[1;35mGhostscript compression failed:\033[1;36m {input_path}\033[0m", file=sys.stderr)
+        sys.exit(1)
+
+
+def recompress_pdf(input_path: str, output_path: str) -> None:
+    """
+    Losslessly recompress the streams of a PDF and remove its metadata with qpdf (through pikepdf), without Ghostscript.
+    Much cheaper than a Ghostscript pass for text-only PDFs, where there are no images to downsample.
+
+    Args:
+        input_path (str): Input PDF path.
+        output_path (str): Output compressed PDF path.
+    """
+
+    pikepdf = import_pikepdf()
+    if pikepdf is None:
+        print(" ❌ \033[1;35mThe qpdf backend requires pikepdf, which failed to import.\033[0m", file=sys.stderr)
         sys.exit(1)
 
+    try:
+        with pikepdf.open(input_path) as pdf:
+            # Remove classic document info dictionary (/Info)
+            if "/Info" in pdf.trailer:
+                del pdf.trailer["/Info"]
+
+            # Remove XMP /Metadata stream if present
+            if "/Metadata" in pdf.Root:
+                del pdf.Root["/Metadata"]
+
+            pdf.save(
+                output_path,
+                compress_streams=True,
+                recompress_flate=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            )
+
+    except pikepdf.PdfError:
+        print(f" ❌ \033[1;35mqpdf compression failed:\033[1;36m {input_path}\033[0m", file=sys.stderr)
+        sys.exit(1)
 
-def process_file(input_file: str, output_file: str, compression: str, delete_original: bool = False) -> None:
+
+def pick_backend(input_path: str) -> str:
     """
+    Choose qpdf for PDFs with little image data, and Ghostscript (which downsamples images) for the others.
+
+    Args:
+        input_path (str): Input PDF path.
+
+    Returns:
+        str: "qpdf" or "ghostscript".
+    """
+
+    pikepdf = import_pikepdf()
+    if pikepdf is None:
+        return "ghostscript"
+
+    try:
+        with pikepdf.open(input_path) as pdf:
+            # Use the declared stream lengths, so no image data has to be read
+            image_bytes = 0
+            for obj in pdf.objects:
+                if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == "/Image":
+                    image_bytes += int(obj.get("/Length", 0))
+
+                    if image_bytes >= QPDF_MAX_IMAGE_BYTES:
+                        return "ghostscript"
+
+    except pikepdf.PdfError:
+        # Leave files qpdf cannot parse to Ghostscript, which may still repair them or reports the failure
+        return "ghostscript"
+
+    return "qpdf"
+
+
+def process_file(
+    input_file: str,
+    output_file: str,
+    compression: str,
+    backend: str = "ghostscript",
+    rendering_threads: int = 1,
+    dpi: int = None,
+    jpeg_quality: int = None,
+    delete_original: bool = False,
+) -> None:
+    """
+    Compress a PDF and remove its metadata. With Ghostscript, its output is piped into the metadata
+    rewrite (strip_pdf_metadata), which always runs since Ghostscript never leaves the document info empty.
+
     Args:
         input_file (str): Path to the input PDF file.
         output_file (str): Path to save the output PDF file.
         compression (str): Compression level.
+        backend (str): One of auto, ghostscript, qpdf.
+        rendering_threads (int): Number of Ghostscript rendering threads.
+        dpi (int): Image resolution overriding the one of the compression level.
+        jpeg_quality (int): JPEG quality overriding the one of the compression level.
         delete_original (bool): Whether to delete the original PDF file after successful processing.
     """
 
-    temp_file = "__temp.pdf"
+    # Image settings are only applied by Ghostscript, so asking for them rules qpdf out
+    if backend == "auto":
+        backend = "ghostscript" if dpi or jpeg_quality else pick_backend(input_path=input_file)
 
-    try:
-        compress_pdf(input_path=input_file, output_path=temp_file, quality=compression)
-        strip_pdf_metadata(input_path=temp_file, output_path=output_file)
+    # Write to a temporary file next to the output and rename it into place once complete,
+    # so a failed run never leaves a partial output behind or clobbers an existing one
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_file = tempfile.mkstemp(prefix=".pdftool-", suffix=".pdf", dir=output_dir)
+    os.close(fd)
 
-        # Only delete original file if output exists and flag is set
-        if delete_original and os.path.isfile(output_file):
-            os.remove(input_file)
+    try:
+        if backend == "qpdf":
+            recompress_pdf(input_path=input_file, output_path=temp_file)
+
+        else:
+            # Ghostscript's output is piped straight into the metadata rewrite, without a temporary file on disk
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+                compress_pdf(
+                    input_path=input_file,
+                    output_path=buffer,
+                    quality=compression,
+                    rendering_threads=rendering_threads,
+                    dpi=dpi,
+                    jpeg_quality=jpeg_quality,
+                )
+                buffer.seek(0)
+
+                # Always rewrite the output: pdfwrite keeps an /Info dictionary with its own /Producer and every
+                # key the pdfmark does not blank, and older versions ignore -dOmitXMP
+                strip_pdf_metadata(input_path=buffer, output_path=temp_file)
+
+        # mkstemp creates the file as 0600, keep the permissions of the output being replaced,
+        # or give it the permissions of a regular new file
+        try:
+            mode = os.stat(output_file).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+
+        os.chmod(temp_file, mode)
+
+        os.replace(temp_file, output_file)
 
     finally:
         # Delete temporary file
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
+    # Only delete original file if output exists and flag is set
+    if delete_original and os.path.isfile(output_file):
+        os.remove(input_file)
+
 
 def single_file_mode(args) -> None:
     input_file = args.input
-    output_file = args.output if args.output else f"{Path(input_file).stem}_compressed.pdf"
+    input_path = Path(input_file)
+    output_file = args.output if args.output else f"{input_path.stem}_compressed.pdf"
 
-    compression = args.compression
+    compression = args.compression.casefold()
+    backend = args.backend
+    dpi = args.dpi
+    jpeg_quality = args.jpeg_quality
     delete_original = args.delete_original
     force = args.force
     verbose = args.verbose
 
     validate_compression_level(compression=compression)
+    validate_backend(backend=backend)
+    validate_image_settings(dpi=dpi, jpeg_quality=jpeg_quality)
     validate_args_single_file(input_file=input_file, output_file=output_file, force=force)
 
-    log(verbose=verbose,
-        message=f"\n 🚀 \033[1;37m Processing:\033[1;32m  {Path(input_file).name}\033[0m")
+    rendering_threads = min(MAX_RENDERING_THREADS, os.cpu_count() or 1)
 
-    input_size = str(os.path.getsize(input_file) / 1000000)
+    log(verbose,
+        "\n 🚀 \033[1;37m Processing:\033[1;32m  {}\033[0m",
+        input_path.name)
 
-    process_file(input_file=input_file, output_file=output_file, compression=compression, delete_original=delete_original)
+    input_size = os.path.getsize(input_file) if verbose else 0
 
-    output_size = str(os.path.getsize(output_file) / 1000000)
+    process_file(
+        input_file=input_file,
+        output_file=output_file,
+        compression=compression,
+        backend=backend,
+        rendering_threads=rendering_threads,
+        dpi=dpi,
+        jpeg_quality=jpeg_quality,
+        delete_original=delete_original,
+    )
 
-    log(verbose=verbose,
-        message=f" ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {input_size} MB\n   Output file size: {output_size} MB\033[0m")
+    output_size = os.path.getsize(output_file) if verbose else 0
+
+    log(verbose,
+        " ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {:.2f} MB\n   Output file size: {:.2f} MB\033[0m",
+        input_size / 1000000, output_size / 1000000)
 
 
 def batch_file_mode(args) -> None:
     input_folder = Path(args.input_folder)
     output_folder = Path(args.output_folder) if args.output_folder else Path(f"{input_folder}_compressed")
 
-    compression = args.compression
-    delete_original = args.delete_original
+    compression = args.compression.casefold()
+    backend = args.backend
+    jobs = args.jobs
     recursive = args.recursive
     verbose = args.verbose
 
     validate_compression_level(compression=compression)
+    validate_backend(backend=backend)
+    validate_image_settings(dpi=args.dpi, jpeg_quality=args.jpeg_quality)
+    validate_jobs(jobs=jobs)
     validate_args_batch_file(input_folder=input_folder)
 
-    pattern = "**/*.pdf" if recursive else "*.pdf"
-    pdf_files = list(input_folder.glob(pattern=pattern, case_sensitive=False))
+    cpu_count = os.cpu_count() or 1
+    max_workers = jobs or cpu_count
 
-    if not pdf_files:
+    # Only scan ahead enough files to size the pool, the rest of the folder
+    # is scanned while the first files are already being compressed
+    pdf_files = iter_pdfs(root=input_folder, recursive=recursive, verbose=verbose)
+    first_files = list(itertools.islice(pdf_files, max_workers))
+
+    if not first_files:
         print(" ❌ \033[1;35mNo PDF files found in the input folder.\033[0m")
         return
 
-    output_folder.mkdir(parents=True, exist_ok=True)
+    # Ghostscript compresses a file on a single core, so run one per core
+    # and split whatever cores are left between their rendering threads
+    max_workers = min(max_workers, len(first_files))
+    rendering_threads = min(MAX_RENDERING_THREADS, max(1, cpu_count // max_workers))
+
+    tasks = _iter_tasks(
+        pdf_files=itertools.chain(first_files, pdf_files),
+        input_folder=input_folder,
+        output_folder=output_folder,
+        options={
+            "compression": compression,
+            "backend": backend,
+            "rendering_threads": rendering_threads,
+            "dpi": args.dpi,
+            "jpeg_quality": args.jpeg_quality,
+            "delete_original": args.delete_original,
+        },
+        verbose=verbose,
+    )
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_worker, tasks))
+
+    processed = [(input_size, output_size) for _, input_size, output_size in results if output_size is not None]
+    failed = [input_file for input_file, _, output_size in results if output_size is None]
+
+    total_input_size = sum(input_size for input_size, _ in processed)
+    total_output_size = sum(output_size for _, output_size in processed)
+
+    log(verbose,
+        "\n\033[1;37m  Batch compression completed.\033[1;32m {}\033[1;37m files processed and saved at:\033[1;32m {}/\033[0m",
+        len(processed), output_folder)
+    log(verbose,
+        "\033[1;32m   Total input size: {:.2f} MB\n   Total output size: {:.2f} MB\033[0m",
+        total_input_size / 1000000, total_output_size / 1000000)
+
+    if failed:
+        print(f" ❌ \033[1;35m{len(failed)} of {len(results)} files failed:\033[1;36m {', '.join(map(str, failed))}\033[0m", file=sys.stderr)
+        sys.exit(1)
+
 
-    for pdf in pdf_files:
+def iter_pdfs(root: str, recursive: bool = False, verbose: bool = False) -> Iterator[os.DirEntry]:
+    """
+    Yield the directory entries of the PDF files in a folder with a single scandir pass per directory.
+    Files with a .pdf extension but no PDF header are skipped, so no Ghostscript process is spawned for them.
+
+    Args:
+        root (str): Folder to scan.
+        recursive (bool): Whether to also scan subfolders.
+        verbose (bool): Whether to log the skipped files.
+    """
+
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                    if is_pdf(entry.path):
+                        yield entry
+                    else:
+                        log(verbose,
+                            " ⚠️  \033[1;33mSkipping, not a PDF file:\033[1;36m {}\033[0m",
+                            entry.path)
+
+
+def is_pdf(path: str) -> bool:
+    """
+    Check the PDF header of a file, reading only its first kilobyte.
+
+    Args:
+        path (str): Path of the file to check.
+
+    Returns:
+        bool: Whether the file starts like a PDF. False when it cannot be read.
+    """
+
+    try:
+        with open(path, "rb", buffering=0) as file:
+            return b"%PDF-" in file.read(PDF_HEADER_WINDOW)
+    except OSError:
+        return False
+
+
+def _iter_tasks(
+    pdf_files: Iterable[os.DirEntry],
+    input_folder: Path,
+    output_folder: Path,
+    options: dict,
+    verbose: bool,
+) -> Iterator[tuple]:
+    """
+    Yield the batch worker tasks, creating each output subfolder the first time it is needed.
+    Each task also names the file PREFETCH_DEPTH positions later, for the worker to prefetch.
+
+    Args:
+        pdf_files (Iterable[os.DirEntry]): PDF files to process.
+        input_folder (Path): Batch input folder.
+        output_folder (Path): Batch output folder.
+        options (dict): process_file keyword arguments shared by every task.
+        verbose (bool): Whether the workers log their progress.
+    """
+
+    created_folders = set()
+    upcoming = collections.deque()
+    for entry in pdf_files:
+        pdf = Path(entry.path)
         relative_path = pdf.relative_to(input_folder)
         output_file = output_folder / relative_path
 
-        output_file.parent.mkdir(parents=True, exist_ok=True)
+        if output_file.parent not in created_folders:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            created_folders.add(output_file.parent)
+
+        upcoming.append((pdf, output_file))
+
+        # The first files are prefetched right away, each later one by the worker of the file PREFETCH_DEPTH positions before it
+        if len(upcoming) <= PREFETCH_DEPTH:
+            prefetch(pdf)
+        else:
+            yield (*upcoming.popleft(), pdf, options, verbose)
+
+    while upcoming:
+        yield (*upcoming.popleft(), None, options, verbose)
 
-        log(verbose=verbose,
-            message=f"\n 🚀 \033[1;37m Processing:\033[1;32m  {pdf.name}\033[0m")
 
-        input_size = str(os.path.getsize(pdf) / 1000000)
+def _worker(task: tuple) -> tuple:
+    """
+    Process a single PDF of a batch. Kept at module level so it can be dispatched to a process pool.
+    A failure is reported and returned instead of raised, so it does not cancel the files still queued.
+
+    Args:
+        task (tuple): (input_file, output_file, prefetch_file, options, verbose), where options are the process_file keyword arguments.
+
+    Returns:
+        tuple: Input file, and input and output file sizes in bytes (0 when not verbose, output size None when it failed).
+    """
+
+    input_file, output_file, prefetch_file, options, verbose = task
+
+    if prefetch_file:
+        prefetch(prefetch_file)
+
+    input_size = os.path.getsize(input_file) if verbose else 0
+
+    try:
+        process_file(input_file=input_file, output_file=output_file, **options)
 
-        process_file(input_file=pdf, output_file=output_file, compression=compression, delete_original=delete_original)
+    except SystemExit:
+        # Ghostscript and qpdf failures are already reported with the file name
+        return input_file, input_size, None
 
-        output_size = str(os.path.getsize(output_file) / 1000000)
+    except Exception as e:
+        print(f" ❌ \033[1;35mError processing \033[1;36m{input_file}\033[1;35m:\033[1;36m {e}\033[0m", file=sys.stderr)
+        return input_file, input_size, None
 
-        log(verbose=verbose,
-            message=f" ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {input_size} MB\n   Output file size: {output_size} MB\033[0m")
+    output_size = os.path.getsize(output_file) if verbose else 0
 
-    log(verbose=verbose,
-        message=f"\n\033[1;37m  Batch compression completed.\033[1;32m {len(pdf_files)}\033[1;37m files processed and saved at:\033[1;32m {output_folder}/\033[0m")
+    # Each file is read and written once, do not let a large batch push everything else out of the page cache
+    evict(input_file, output_file)
+
+    # One write per file, so the messages of parallel workers do not interleave
+    log(verbose,
+        "\n 🚀 \033[1;37m Processing:\033[1;32m  {}\033[0m\n ✅ \033[1;37m Compression completed:\n\033[1;32m   Input file size: {:.2f} MB\n   Output file size: {:.2f} MB\033[0m",
+        input_file.name, input_size / 1000000, output_size / 1000000)
+
+    return input_file, input_size, output_size
+
+
+def prefetch(path: str) -> None:
+    """
+    Ask the kernel to start reading a file into the page cache in the background,
+    so the read overlaps with the compression of the previous files. No-op where posix_fadvise is not available.
+
+    Args:
+        path (str): Path of the file that will be read soon.
+    """
+
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def evict(*paths: str) -> None:
+    """
+    Tell the kernel the cached pages of files are no longer needed. Pages still waiting to be written back stay
+    cached until written. No-op where posix_fadvise is not available, and for files that no longer exist.
+
+    Args:
+        paths (str): Paths of the files that will not be read again.
+    """
+
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
 
 
 def validate_compression_level(compression: str) -> None:
     # Check if the compression level is valid
     if compression not in COMPRESSION_LEVELS:
-        print(f" ❌ \033[1;35mInvalid compression level:\033[1;36m {compression}\033[0m", file=sys.stderr)
+        print(f" ❌ \033[1;35mInvalid compression level:\033[1;36m {compression}\033[1;35m (choose from:\033[1;36m {COMPRESSION_LEVELS_LIST}\033[1;35m)\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+
+def validate_backend(backend: str) -> None:
+    # Check if the backend is valid and available
+    if backend not in BACKENDS:
+        print(f" ❌ \033[1;35mInvalid backend:\033[1;36m {backend}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+    if backend == "qpdf" and not HAS_PIKEPDF:
+        print(" ❌ \033[1;35mThe qpdf backend requires pikepdf:\033[1;36m pip install pikepdf\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+
+def validate_image_settings(dpi: int, jpeg_quality: int) -> None:
+    # Check if the image resolution and JPEG quality overrides are valid
+    if dpi is not None and dpi < 1:
+        print(f" ❌ \033[1;35mInvalid image resolution:\033[1;36m {dpi}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+    if jpeg_quality is not None and not 1 <= jpeg_quality <= 100:
+        print(f" ❌ \033[1;35mJPEG quality must be between 1 and 100:\033[1;36m {jpeg_quality}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
+
+def validate_jobs(jobs: int) -> None:
+    # Check if the number of parallel jobs is valid
+    if jobs is not None and jobs < 1:
+        print(f" ❌ \033[1;35mInvalid number of jobs:\033[1;36m {jobs}\033[0m", file=sys.stderr)
         sys.exit(2)
 
 
@@ -194,16 +722,27 @@ def validate_args_single_file(input_file: str, output_file: str, force: bool = F
         print(f" ❌ \033[1;35mInput file needs to be a .pdf file:\033[1;36m {input_file}\033[0m", file=sys.stderr)
         sys.exit(2)
 
+    # Check if the input file really is a PDF, not just named like one
+    if not is_pdf(input_file):
+        print(f" ❌ \033[1;35mInput file is not a valid PDF:\033[1;36m {input_file}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
     # Check if the input file name is safe
-    if re.search("[|;`><{}#*]", input_file):
+    if not UNSAFE_CHARS.isdisjoint(input_file):
         print(f" ❌ \033[1;35mInput file \033[1;36m\"{input_file}\"\033[1;35m contains invalid characters:\033[1;36m [ | ; ` > < {{ }} # *]\033[0m", file=sys.stderr)
         sys.exit(2)
 
     # Check if the output file name is safe
-    if re.search('[|;`><{}#*]', output_file):
+    if not UNSAFE_CHARS.isdisjoint(output_file):
         print(f" ❌ \033[1;35mOutput file \033[1;36m\"{output_file}\"\033[1;35m contains invalid characters:\033[1;36m [ | ; ` > < {{ }} # *]\033[0m", file=sys.stderr)
         sys.exit(2)
 
+    # Check if the output folder exists
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.isdir(output_dir):
+        print(f" ❌ \033[1;35mOutput folder does not exist:\033[1;36m {output_dir}\033[0m", file=sys.stderr)
+        sys.exit(2)
+
     # Check if the output file is a .pdf file
     if not output_file.lower().endswith(".pdf") and not force:
         ask = f" ❔ \033[1;31mOutput file \033[1;36m\"{output_file}\"\033[1;31m does not end with \".pdf\". Are you sure you want to continue?\033[1;36m (y/n)\033[0m "
@@ -226,9 +765,11 @@ def validate_args_batch_file(input_folder: str) -> None:
         sys.exit(2)
 
 
-def log(message: str, verbose: bool) -> None:
+def log(verbose: bool, message: str, *args) -> None:
+    # Only format the message when it is going to be printed, and write it out in a single call
     if verbose:
-        print(message)
+        sys.stdout.write((message.format(*args) if args else message) + "\n")
+        sys.stdout.flush()
 
 
 def main():
@@ -262,9 +803,27 @@ def main():
         ),
     )
 
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default="ghostscript",
+        help=(
+            "Compression Backend (default: ghostscript):\n"
+            "Option       Description\n"
+            "-----------  ----------------------------------------------------------\n"
+            "auto         qpdf for PDFs with little image data, Ghostscript otherwise\n"
+            "ghostscript  Always use Ghostscript (downsamples and re-encodes images)\n"
+            "qpdf         Always use qpdf: lossless stream recompression (needs pikepdf)\n"
+        ),
+    )
+
+    parser.add_argument("--dpi", type=int, default=None, help="Resolution to downsample images to, overriding the compression level's one")
+    parser.add_argument("--jpeg-quality", type=int, default=None, help="JPEG quality (1-100) to re-encode images with, overriding the compression level's one")
     parser.add_argument("--delete-original", action="store_true", help="Delete original PDF files after successful compression")
     parser.add_argument("-f", "--force", action="store_true", help="Overwrite output files without confirmation")
     parser.add_argument("-r", "--recursive", action="store_true", help="Recursively process subfolders (only with --input-folder)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of files to compress in parallel in batch mode (default: number of CPUs)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
 
     args = parser.parse_args()